@@ -2,14 +2,23 @@
 LaTeX to PDF Conversion Service
 Converts JSON data containing lesson content into professionally formatted PDFs
 """
+import io
 import os
+import re
+import hashlib
+import hmac
+import shutil
+import stat
 import subprocess
 import tempfile
+import time
 import logging
 import json
+from datetime import date
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 
+import orjson
 from flask import Flask, request, send_file, jsonify
 from werkzeug.exceptions import BadRequest
 
@@ -25,16 +34,105 @@ app = Flask(__name__)
 
 # Configuration
 API_SECRET = os.getenv("API_SECRET", "default_secret")
+_EXPECTED_AUTH = f"Bearer {API_SECRET}".encode('utf-8')
 MAX_EXERCISES = int(os.getenv("MAX_EXERCISES", "50"))
+MAX_BATCH = int(os.getenv("MAX_BATCH", "20"))
 MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", "1048576"))  # 1MB default
 
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf-compiler-cache"))
+PDF_CACHE_MAX_ENTRIES = int(os.getenv("PDF_CACHE_MAX_ENTRIES", "500"))
+PDF_MAX_AGE = int(os.getenv("PDF_MAX_AGE", "3600"))
+LATEX_TMPFS = os.getenv("LATEX_TMPFS", "/dev/shm")
+
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
+# Prepare the compiled PDF cache (an empty PDF_CACHE_DIR disables it).
+# Cached files are served as-is, so the directory must be private to this
+# user; otherwise anyone who can write to it could plant PDFs.
+if PDF_CACHE_DIR:
+    try:
+        os.makedirs(PDF_CACHE_DIR, mode=0o700, exist_ok=True)
+        cache_stat = os.lstat(PDF_CACHE_DIR)
+        if not stat.S_ISDIR(cache_stat.st_mode):
+            raise OSError("not a directory")
+        if hasattr(os, "geteuid") and cache_stat.st_uid != os.geteuid():
+            raise OSError("owned by another user")
+        if cache_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise OSError("writable by group or others")
+    except OSError as e:
+        logger.warning(f"PDF cache disabled, cannot use {PDF_CACHE_DIR}: {e}")
+        PDF_CACHE_DIR = ""
+
+# LaTeX compilers in order of preference: Tectonic first, fall back to pdflatex
+LATEX_COMPILERS = [
+    {"name": "tectonic", "runs": 1},
+    {"name": "pdflatex", "runs": 2},  # Up to two passes to resolve references
+]
+
+# Compilers found on PATH, populated by refresh_compilers()
+_AVAILABLE_COMPILERS: List[Dict[str, Any]] = []
+
+# Compile in RAM-backed storage when available, otherwise the default temp dir
+if LATEX_TMPFS and os.path.isdir(LATEX_TMPFS) and os.access(LATEX_TMPFS, os.W_OK | os.X_OK):
+    LATEX_WORK_DIR: Optional[str] = LATEX_TMPFS
+else:
+    LATEX_WORK_DIR = None
+    logger.info(f"{LATEX_TMPFS or 'LATEX_TMPFS'} not usable, compiling in {tempfile.gettempdir()}")
+
 # Debug: Log API_SECRET at startup (masked for security)
 logger.info(f"API_SECRET loaded: {'*' * (len(API_SECRET) - 4) + API_SECRET[-4:] if len(API_SECRET) > 4 else '****'}")
 logger.info(f"API_SECRET length: {len(API_SECRET)}")
 
 
+# LaTeX special characters and their escaped forms. Escaping is done in a
+# single regex pass so replacement output is never rescanned.
+_LATEX_ESCAPES = {
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+_LATEX_SPECIALS_RE = re.compile('|'.join(re.escape(c) for c in _LATEX_ESCAPES))
+_LATEX_SPECIAL_CHARS = frozenset(_LATEX_ESCAPES)
+
+# Log messages indicating another LaTeX pass is needed to resolve references.
+# Tables of contents/figures/tables trigger no kernel warning, only a missing
+# file notice on the first pass.
+_LATEX_RERUN_RE = re.compile(
+    rb"Rerun to get|There were undefined references|Label\(s\) may have changed"
+    rb"|No file \S+\.(?:toc|lof|lot)\b"
+)
+
+
+# Document preamble, split around the topic title in the page header
+_PREAMBLE_PREFIX = r"""\documentclass[12pt]{article}
+\usepackage[utf8]{inputenc}
+\usepackage{amsmath, amssymb}
+\usepackage{geometry}
+\geometry{letterpaper, margin=1.0in}
+\usepackage{parskip}
+\setlength{\parskip}{1em}
+\usepackage{fancyhdr}
+\usepackage{lastpage}
+
+\pagestyle{fancy}
+\fancyhead[L]{"""
+
+_PREAMBLE_SUFFIX = r"""}
+\fancyhead[R]{\today}
+\fancyfoot[C]{Page \thepage\ of \pageref{LastPage}}
+
+\begin{document}
+
+"""
+
+
 def escape_latex(text: str) -> str:
     """
     Escape special LaTeX characters to prevent compilation errors.
@@ -44,27 +142,22 @@ def escape_latex(text: str) -> str:
         
     Returns:
         Text with special characters properly escaped
+        
+    Raises:
+        ValueError: If text is not a string
     """
     if not text:
         return ""
     
-    replacements = {
-        '&': r'\&',
-        '%': r'\%',
-        '$': r'\$',
-        '#': r'\#',
-        '_': r'\_',
-        '{': r'\{',
-        '}': r'\}',
-        '~': r'\textasciitilde{}',
-        '^': r'\textasciicircum{}',
-        '\\': r'\textbackslash{}',
-    }
+    # isdisjoint accepts any iterable, so only strings may take the fast path
+    if not isinstance(text, str):
+        raise ValueError(f"Expected text, got {type(text).__name__}")
     
-    for old, new in replacements.items():
-        text = text.replace(old, new)
+    # Fast path: most titles, difficulties and hints need no escaping
+    if _LATEX_SPECIAL_CHARS.isdisjoint(text):
+        return text
     
-    return text
+    return _LATEX_SPECIALS_RE.sub(lambda m: _LATEX_ESCAPES[m.group(0)], text)
 
 
 def validate_exercise(exercise: Dict[str, Any], index: int) -> None:
@@ -89,12 +182,19 @@ def validate_exercise(exercise: Dict[str, Any], index: int) -> None:
     
     if len(exercise['question'].strip()) == 0:
         raise ValueError(f"Exercise {index} 'question' cannot be empty")
+    
+    # null is treated like a missing optional field
+    if exercise.get('difficulty') is not None and not isinstance(exercise['difficulty'], str):
+        raise ValueError(f"Exercise {index} 'difficulty' must be a string")
 
 
 def validate_input_data(data: Dict[str, Any]) -> None:
     """
     Validate the input JSON structure.
     
+    Individual exercises are validated by generate_latex_source while the
+    document is built, so the exercise list is only walked once.
+    
     Args:
         data: Input JSON data to validate
         
@@ -104,6 +204,11 @@ def validate_input_data(data: Dict[str, Any]) -> None:
     if not isinstance(data, dict):
         raise ValueError("Input must be a JSON object")
     
+    for field in ('topic_title', 'theory_content'):
+        # null is treated like a missing optional field
+        if data.get(field) is not None and not isinstance(data[field], str):
+            raise ValueError(f"'{field}' must be a string")
+    
     if 'exercises' not in data:
         raise ValueError("Missing required field: 'exercises'")
     
@@ -116,83 +221,233 @@ def validate_input_data(data: Dict[str, Any]) -> None:
     
     if len(exercises) > MAX_EXERCISES:
         raise ValueError(f"Too many exercises. Maximum allowed: {MAX_EXERCISES}")
-    
-    for i, exercise in enumerate(exercises, 1):
-        validate_exercise(exercise, i)
 
 
-def generate_latex_source(data: Dict[str, Any]) -> str:
+def validate_batch_data(data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
-    Convert JSON data into a complete LaTeX document.
+    Validate the input JSON structure of a batch conversion.
     
     Args:
-        data: Validated input data containing topic, theory, and exercises
+        data: Input JSON data to validate
         
     Returns:
-        Complete LaTeX document as a string
+        The list of lessons in the batch
+        
+    Raises:
+        ValueError: If validation fails
     """
-    # Extract and sanitize topic title
-    topic_title = data.get("topic_title", "Daily Lesson")
-    topic_title = escape_latex(topic_title)
+    if not isinstance(data, dict):
+        raise ValueError("Input must be a JSON object")
     
-    # Start document
-    latex = r"""\documentclass[12pt]{article}
-\usepackage[utf8]{inputenc}
-\usepackage{amsmath, amssymb}
-\usepackage{geometry}
-\geometry{letterpaper, margin=1.0in}
-\usepackage{parskip}
-\setlength{\parskip}{1em}
-\usepackage{fancyhdr}
-\usepackage{lastpage}
-
-\pagestyle{fancy}
-\fancyhead[L]{%s}
-\fancyhead[R]{\today}
-\fancyfoot[C]{Page \thepage\ of \pageref{LastPage}}
+    if 'lessons' not in data:
+        raise ValueError("Missing required field: 'lessons'")
+    
+    lessons = data['lessons']
+    if not isinstance(lessons, list):
+        raise ValueError("'lessons' must be an array")
+    
+    if len(lessons) == 0:
+        raise ValueError("'lessons' array cannot be empty")
+    
+    if len(lessons) > MAX_BATCH:
+        raise ValueError(f"Too many lessons. Maximum allowed: {MAX_BATCH}")
+    
+    for i, lesson in enumerate(lessons, 1):
+        try:
+            validate_input_data(lesson)
+        except ValueError as e:
+            raise ValueError(f"Lesson {i}: {e}") from e
+    
+    return lessons
 
-\begin{document}
 
-""" % topic_title
+def _append_lesson_body(data: Dict[str, Any], append: Callable[[str], None]) -> None:
+    """
+    Append the theory and exercise sections of one lesson to a document.
     
+    Args:
+        data: Lesson data containing theory and exercises
+        append: Callback receiving each LaTeX fragment in order
+        
+    Raises:
+        ValueError: If an exercise fails validation
+    """
     # Add theory section if present
-    theory_content = data.get("theory_content", "").strip()
+    theory_content = (data.get("theory_content") or "").strip()
     if theory_content:
-        latex += r"\section*{Theory}" + "\n"
-        latex += escape_latex(theory_content) + "\n"
-        latex += r"\newpage" + "\n\n"
+        append("\\section*{Theory}\n")
+        append(escape_latex(theory_content))
+        append("\n\\newpage\n\n")
     
     # Add exercises section
-    latex += r"\section*{Exercises}" + "\n\n"
+    append("\\section*{Exercises}\n\n")
     
     exercises = data.get("exercises", [])
+    exercise_blocks = []
     for i, ex in enumerate(exercises, 1):
+        validate_exercise(ex, i)
         question = escape_latex(ex.get("question", ""))
         difficulty = escape_latex(ex.get("difficulty", "General"))
         hints = ex.get("hints", [])
         
-        latex += r"\subsection*{Question %d (%s)}" % (i, difficulty) + "\n"
-        latex += question + "\n\n"
-        
         # Add hints if present
-        if hints and isinstance(hints, list):
-            latex += r"\textbf{Hints:}" + "\n"
-            latex += r"\begin{itemize}" + "\n"
-            for hint in hints:
-                if isinstance(hint, str) and hint.strip():
-                    latex += r"\item " + escape_latex(hint) + "\n"
-            latex += r"\end{itemize}" + "\n\n"
+        hints_block = ""
+        if isinstance(hints, list):
+            hint_items = "".join(
+                f"\\item {escape_latex(hint)}\n"
+                for hint in hints
+                if isinstance(hint, str) and hint.strip()
+            )
+            if hint_items:
+                hints_block = f"\\textbf{{Hints:}}\n\\begin{{itemize}}\n{hint_items}\\end{{itemize}}\n\n"
         
-        latex += r"\vfill" + "\n"
-        latex += r"\textit{(Space for solution...)}" + "\n"
+        exercise_blocks.append(
+            f"\\subsection*{{Question {i} ({difficulty})}}\n"
+            f"{question}\n\n"
+            f"{hints_block}"
+            "\\vfill\n\\textit{(Space for solution...)}\n"
+        )
+    
+    # Page break between exercises, none after the last one
+    append("\\newpage\n\n".join(exercise_blocks))
+
+
+def generate_latex_source(data: Dict[str, Any]) -> str:
+    """
+    Convert JSON data into a complete LaTeX document.
+    
+    Args:
+        data: Input data containing topic, theory, and exercises, already
+            checked by validate_input_data
         
-        # Add page break except after last exercise
-        if i < len(exercises):
-            latex += r"\newpage" + "\n\n"
+    Returns:
+        Complete LaTeX document as a string
+        
+    Raises:
+        ValueError: If an exercise fails validation
+    """
+    # Extract and sanitize topic title
+    topic_title = escape_latex(data.get("topic_title", "Daily Lesson"))
+    
+    # Start document
+    parts: List[str] = [_PREAMBLE_PREFIX, topic_title, _PREAMBLE_SUFFIX]
+    
+    _append_lesson_body(data, parts.append)
+    
+    parts.append("\\end{document}\n")
+    
+    return "".join(parts)
+
+
+def generate_latex_batch(lessons: List[Dict[str, Any]]) -> str:
+    """
+    Convert several lessons into a single LaTeX document.
+    
+    Each lesson starts on a new page with its own title in the page header,
+    so the whole batch compiles in one LaTeX run.
+    
+    Args:
+        lessons: Lesson data, each already checked by validate_input_data
+        
+    Returns:
+        Complete LaTeX document as a string
+        
+    Raises:
+        ValueError: If an exercise fails validation
+    """
+    parts: List[str] = []
+    append = parts.append
+    
+    for i, lesson in enumerate(lessons, 1):
+        topic_title = escape_latex(lesson.get("topic_title", "Daily Lesson"))
+        
+        if i == 1:
+            parts += [_PREAMBLE_PREFIX, topic_title, _PREAMBLE_SUFFIX]
+        else:
+            append(f"\n\\clearpage\n\\fancyhead[L]{{{topic_title}}}\n\n")
+        
+        try:
+            _append_lesson_body(lesson, append)
+        except ValueError as e:
+            raise ValueError(f"Lesson {i}: {e}") from e
+    
+    append("\\end{document}\n")
+    
+    return "".join(parts)
+
+
+def refresh_compilers() -> List[str]:
+    """
+    Detect installed LaTeX compilers and update the cached compiler list.
     
-    latex += r"\end{document}" + "\n"
+    Detection runs once at import time so requests never pay for probing
+    the PATH; call this again if compilers are installed or removed while
+    the service is running.
     
-    return latex
+    Returns:
+        Names of the available compilers in order of preference
+    """
+    global _AVAILABLE_COMPILERS
+    
+    available = []
+    for compiler in LATEX_COMPILERS:
+        path = shutil.which(compiler["name"])
+        if path:
+            available.append({**compiler, "path": path})
+        else:
+            logger.debug(f"{compiler['name']} not available")
+    
+    _AVAILABLE_COMPILERS = available
+    names = [compiler["name"] for compiler in available]
+    logger.info(f"Available LaTeX compilers: {', '.join(names) or 'none'}")
+    return names
+
+
+refresh_compilers()
+
+
+def latex_needs_rerun(log_path: Path) -> bool:
+    """
+    Check whether a LaTeX run left unresolved references behind.
+    
+    Args:
+        log_path: Log file written by the LaTeX run
+        
+    Returns:
+        True if the log asks for another pass
+    """
+    try:
+        return _LATEX_RERUN_RE.search(log_path.read_bytes()) is not None
+    except FileNotFoundError:
+        return False
+
+
+def latex_log_errors(log_path: Path) -> str:
+    """
+    Extract error messages from a LaTeX log file.
+    
+    Args:
+        log_path: Log file written by the LaTeX run
+        
+    Returns:
+        Error lines (starting with '!') and the source line that follows
+        each of them, or an empty string if there are none
+    """
+    try:
+        lines = log_path.read_text(encoding='utf-8', errors='replace').splitlines()
+    except FileNotFoundError:
+        return ""
+    
+    errors = []
+    for i, line in enumerate(lines):
+        if line.startswith("!"):
+            errors.append(line)
+            # The offending source line is reported as "l.<number> ..."
+            context = next((l for l in lines[i + 1:i + 10] if l.startswith("l.")), None)
+            if context:
+                errors.append(context)
+    
+    return "\n".join(errors)
 
 
 def compile_latex_to_pdf(latex_source: str) -> bytes:
@@ -208,55 +463,45 @@ def compile_latex_to_pdf(latex_source: str) -> bytes:
     Raises:
         RuntimeError: If compilation fails
     """
-    with tempfile.TemporaryDirectory() as temp_dir:
+    with tempfile.TemporaryDirectory(dir=LATEX_WORK_DIR, prefix='latex-') as temp_dir:
         tex_path = Path(temp_dir) / "output.tex"
         pdf_path = Path(temp_dir) / "output.pdf"
+        log_path = Path(temp_dir) / "output.log"
         
         # Write LaTeX source
         tex_path.write_text(latex_source, encoding='utf-8')
         logger.info(f"Wrote LaTeX source to {tex_path}")
         
-        # Try Tectonic first, fall back to pdflatex
-        compilers = [
-            {
-                "name": "tectonic",
-                "cmd": ["tectonic", "-o", temp_dir, str(tex_path)],
-                "runs": 1
-            },
-            {
-                "name": "pdflatex",
-                "cmd": ["pdflatex", "-interaction=nonstopmode", "-output-directory", temp_dir, str(tex_path)],
-                "runs": 2  # Run twice for references
-            }
-        ]
+        # Command-line arguments for each compiler
+        compiler_args = {
+            "tectonic": ["-X", "compile", "--untrusted", "--outdir", temp_dir, str(tex_path)],
+            "pdflatex": [
+                "-interaction=batchmode", "-halt-on-error", "-no-file-line-error",
+                "-output-directory", temp_dir, str(tex_path)
+            ],
+        }
         
-        last_error = None
+        last_error = "No LaTeX compiler available"
         
-        for compiler in compilers:
-            # Check if compiler exists
-            try:
-                subprocess.run(
-                    [compiler["name"], "--version"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=5
-                )
-            except (subprocess.TimeoutExpired, FileNotFoundError):
-                logger.debug(f"{compiler['name']} not available, trying next compiler")
-                continue
+        for compiler in _AVAILABLE_COMPILERS:
+            cmd = [compiler["path"], *compiler_args[compiler["name"]]]
             
             try:
                 # Run compilation (possibly multiple times)
                 for run in range(compiler["runs"]):
                     logger.info(f"Running {compiler['name']} (run {run + 1}/{compiler['runs']})")
                     result = subprocess.run(
-                        compiler["cmd"],
+                        cmd,
                         check=True,
                         stdout=subprocess.PIPE,
                         stderr=subprocess.PIPE,
                         timeout=30,
                         cwd=temp_dir
                     )
+                    
+                    # Skip remaining passes once all references are resolved
+                    if run + 1 < compiler["runs"] and not latex_needs_rerun(log_path):
+                        break
                 
                 logger.info(f"{compiler['name']} compilation successful")
                 
@@ -267,13 +512,19 @@ def compile_latex_to_pdf(latex_source: str) -> bytes:
                 # Read and return PDF
                 return pdf_path.read_bytes()
                 
+            except FileNotFoundError:
+                last_error = f"{compiler['name']} not found at {compiler['path']}"
+                logger.error(last_error)
+                continue
+                
             except subprocess.TimeoutExpired:
                 last_error = f"{compiler['name']} compilation timed out"
                 logger.error(last_error)
                 continue
                 
             except subprocess.CalledProcessError as e:
-                error_msg = e.stderr.decode('utf-8', errors='replace')
+                # pdflatex in batchmode reports errors only in its log
+                error_msg = e.stderr.decode('utf-8', errors='replace').strip() or latex_log_errors(log_path)
                 last_error = f"{compiler['name']} compilation failed: {error_msg}"
                 logger.error(last_error)
                 continue
@@ -282,25 +533,242 @@ def compile_latex_to_pdf(latex_source: str) -> bytes:
         raise RuntimeError(f"LaTeX compilation failed. Last error: {last_error}")
 
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint for container orchestration."""
-    # Check which LaTeX compiler is available
-    compilers = []
+def warm_up_compiler() -> None:
+    """
+    Compile a throwaway lesson so the first real request starts warm.
+    
+    This pulls the compiler, format files and fonts into the OS page cache
+    and fills Tectonic's package cache. The PDF cache is bypassed so the
+    compiler always runs. Any failure is logged rather than raised so it
+    cannot prevent the server from starting; /health is not affected, and
+    the failure resurfaces on the first conversion request.
+    """
+    if not _AVAILABLE_COMPILERS:
+        return
     
-    for compiler_name in ["tectonic", "pdflatex"]:
+    start = time.monotonic()
+    try:
+        compile_latex_to_pdf(generate_latex_source({"exercises": [{"question": "warmup"}]}))
+    except Exception as e:
+        logger.warning(f"LaTeX warm-up failed: {e}")
+        return
+    
+    logger.info(f"LaTeX warm-up finished in {time.monotonic() - start:.2f}s")
+
+
+def pdf_cache_key(latex_source: str) -> str:
+    """
+    Compute the content-addressed cache key for a LaTeX document.
+    
+    Args:
+        latex_source: Complete LaTeX document source
+        
+    Returns:
+        Hex digest identifying the compiled PDF
+    """
+    # \today is expanded at compile time, so the date is part of the key
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(date.today().isoformat().encode('utf-8'))
+    digest.update(latex_source.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _store_cached_pdf(cache_path: Path, pdf_bytes: bytes) -> None:
+    """
+    Atomically write a compiled PDF into the cache and evict old entries.
+    
+    Args:
+        cache_path: Destination path inside PDF_CACHE_DIR
+        pdf_bytes: PDF file contents
+    """
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=PDF_CACHE_DIR, suffix='.tmp', delete=False) as tmp:
+            tmp_path = tmp.name
+            tmp.write(pdf_bytes)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to write PDF cache entry: {e}")
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        return
+    
+    # Evict least recently used entries beyond the configured limit
+    try:
+        entries = sorted(Path(PDF_CACHE_DIR).glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+        for stale in entries[:max(len(entries) - PDF_CACHE_MAX_ENTRIES, 0)]:
+            stale.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Failed to evict PDF cache entries: {e}")
+
+
+def cached_pdf_path(key: str) -> Optional[Path]:
+    """
+    Look up a compiled PDF in the cache, marking it as recently used.
+    
+    Args:
+        key: pdf_cache_key of the LaTeX source
+        
+    Returns:
+        Path of the cached PDF, or None on a miss or if caching is disabled
+    """
+    if not PDF_CACHE_DIR:
+        return None
+    
+    cache_path = Path(PDF_CACHE_DIR) / f"{key}.pdf"
+    try:
+        os.utime(cache_path)  # Mark as recently used for eviction
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Failed to access PDF cache entry {key}: {e}")
+        return None
+    
+    return cache_path
+
+
+def compile_and_cache_pdf(latex_source: str, key: str) -> bytes:
+    """
+    Compile a LaTeX document and store the result in the PDF cache.
+    
+    Callers look the document up with cached_pdf_path first; this only
+    handles the miss.
+    
+    Args:
+        latex_source: Complete LaTeX document source
+        key: pdf_cache_key of the source
+        
+    Returns:
+        PDF file contents as bytes
+        
+    Raises:
+        RuntimeError: If compilation fails
+    """
+    pdf_bytes = compile_latex_to_pdf(latex_source)
+    if PDF_CACHE_DIR:
+        _store_cached_pdf(Path(PDF_CACHE_DIR) / f"{key}.pdf", pdf_bytes)
+    return pdf_bytes
+
+
+def is_authorized(auth_header: Optional[str]) -> bool:
+    """
+    Check an Authorization header against the configured API secret.
+    
+    Args:
+        auth_header: Value of the Authorization header, if any
+        
+    Returns:
+        True if the header carries the expected bearer token
+    """
+    if not auth_header:
+        return False
+    # Constant-time comparison avoids leaking the secret through timing
+    return hmac.compare_digest(auth_header.encode('utf-8'), _EXPECTED_AUTH)
+
+
+def parse_json_body() -> Any:
+    """
+    Decode the JSON body of the current request.
+    
+    Returns:
+        Decoded JSON value
+        
+    Raises:
+        BadRequest: If the body is not JSON
+    """
+    if not request.is_json:
+        raise BadRequest("Content-Type must be application/json")
+    
+    try:
+        return orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError as e:
+        raise BadRequest(f"Invalid JSON: {e}")
+
+
+def _set_pdf_cache_headers(response, etag: str):
+    """
+    Mark a PDF response as privately cacheable under the given ETag.
+    
+    Args:
+        response: Flask response to update
+        etag: Strong ETag identifying the PDF
+        
+    Returns:
+        The updated response
+    """
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = PDF_MAX_AGE
+    return response
+
+
+def pdf_response(latex_source: str, download_name: str = 'lesson.pdf'):
+    """
+    Build a download response for a LaTeX document's PDF.
+    
+    The ETag is the document's cache key, so a client presenting it in
+    If-None-Match learns the PDF is unchanged without it being compiled
+    or transferred again. The conversion routes are POST-only, so this is
+    answered with 412 Precondition Failed (RFC 9110 section 13.1.2); a
+    wildcard If-None-Match is ignored.
+    
+    Args:
+        latex_source: Complete LaTeX document source
+        download_name: Filename suggested to the client
+        
+    Returns:
+        Flask response streaming the PDF as an attachment, or a 412
+        
+    Raises:
+        RuntimeError: If compilation fails
+    """
+    etag = pdf_cache_key(latex_source)
+    
+    if_none_match = request.if_none_match
+    if not if_none_match.star_tag and if_none_match.contains_weak(etag):
+        logger.info(f"PDF not modified ({etag})")
+        return _set_pdf_cache_headers(app.response_class(status=412), etag)
+    
+    # Stream cache hits straight from disk instead of buffering them
+    cache_path = cached_pdf_path(etag)
+    if cache_path is not None:
         try:
-            subprocess.run(
-                [compiler_name, "--version"],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=5
+            response = send_file(
+                cache_path,
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name=download_name,
+                etag=False
             )
-            compilers.append(compiler_name)
-        except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.CalledProcessError):
+            logger.info(f"PDF cache hit ({etag})")
+            return _set_pdf_cache_headers(response, etag)
+        except FileNotFoundError:
+            # Evicted since the lookup, fall through and recompile
             pass
     
+    pdf_bytes = compile_and_cache_pdf(latex_source, etag)
+    logger.info(f"Compiled PDF ({len(pdf_bytes)} bytes)")
+    
+    response = send_file(
+        io.BytesIO(pdf_bytes),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=download_name,
+        etag=False
+    )
+    return _set_pdf_cache_headers(response, etag)
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint for container orchestration."""
+    compilers = [compiler["name"] for compiler in _AVAILABLE_COMPILERS]
+    
     if not compilers:
         return jsonify({
             "status": "unhealthy",
@@ -337,25 +805,27 @@ def convert_to_pdf():
     """
     # Verify authentication
     auth_header = request.headers.get('Authorization')
-    expected_auth = f"Bearer {API_SECRET}"
+    authorized = is_authorized(auth_header)
     
     # Debug logging
-    logger.debug(f"Header length: {len(auth_header) if auth_header else 0}, Expected length: {len(expected_auth)}")
-    logger.debug(f"Headers match: {auth_header == expected_auth}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Header length: {len(auth_header) if auth_header else 0}, Expected length: {len(API_SECRET) + len('Bearer ')}")
+        logger.debug(f"Headers match: {authorized}")
     
-    if auth_header != expected_auth:
+    if not authorized:
         logger.warning(f"Unauthorized access attempt - Header mismatch")
-        logger.warning(f"Received: '{auth_header}'")
+        # Never log the presented credential, only its size
+        logger.warning(f"Received header length: {len(auth_header) if auth_header else 0}")
         return jsonify({"error": "Unauthorized"}), 401
     
     # Parse and validate input
     try:
-        if not request.is_json:
-            raise BadRequest("Content-Type must be application/json")
-        
-        data = request.get_json()
+        data = parse_json_body()
         validate_input_data(data)
         
+        # Exercises are validated as the document is generated
+        latex_source = generate_latex_source(data)
+        
     except BadRequest as e:
         logger.warning(f"Bad request: {e}")
         return jsonify({"error": str(e)}), 400
@@ -366,32 +836,11 @@ def convert_to_pdf():
         logger.error(f"Error parsing request: {e}")
         return jsonify({"error": "Invalid request format"}), 400
     
-    # Generate and compile
+    # Compile
     try:
-        latex_source = generate_latex_source(data)
         logger.info(f"Generated LaTeX document ({len(latex_source)} bytes)")
         
-        pdf_bytes = compile_latex_to_pdf(latex_source)
-        logger.info(f"Compiled PDF ({len(pdf_bytes)} bytes)")
-        
-        # Create temporary file for response
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            tmp.write(pdf_bytes)
-            tmp_path = tmp.name
-        
-        try:
-            return send_file(
-                tmp_path,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name='lesson.pdf'
-            )
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(tmp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp file: {e}")
+        return pdf_response(latex_source)
         
     except RuntimeError as e:
         logger.error(f"Compilation error: {e}")
@@ -413,10 +862,7 @@ def convert_tex_to_pdf():
         PDF file or error response
     """
     # Verify authentication
-    auth_header = request.headers.get('Authorization')
-    expected_auth = f"Bearer {API_SECRET}"
-    
-    if auth_header != expected_auth:
+    if not is_authorized(request.headers.get('Authorization')):
         logger.warning(f"Unauthorized access attempt to /convert/tex")
         return jsonify({"error": "Unauthorized"}), 401
     
@@ -434,27 +880,68 @@ def convert_tex_to_pdf():
         logger.info(f"Received raw LaTeX document ({len(latex_source)} bytes)")
         
         # Compile
-        pdf_bytes = compile_latex_to_pdf(latex_source)
-        logger.info(f"Compiled PDF ({len(pdf_bytes)} bytes)")
+        return pdf_response(latex_source)
         
-        # Create temporary file for response
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            tmp.write(pdf_bytes)
-            tmp_path = tmp.name
+    except RuntimeError as e:
+        logger.error(f"Compilation error: {e}")
+        return jsonify({"error": "PDF compilation failed", "details": str(e)}), 500
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}", exc_info=True)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/convert/batch', methods=['POST'])
+def convert_batch_to_pdf():
+    """
+    Convert several JSON lessons into a single PDF with one LaTeX run.
+    
+    Expected JSON format:
+    {
+        "lessons": [
+            {
+                "topic_title": "Algebra Basics",
+                "exercises": [{"question": "Solve for x: 2x + 3 = 7"}]
+            },
+            {
+                "topic_title": "Geometry Basics",
+                "exercises": [{"question": "Find the area of a unit circle"}]
+            }
+        ]
+    }
+    
+    Each lesson uses the same format as /convert and starts on a new page.
+    
+    Returns:
+        PDF file or error response
+    """
+    # Verify authentication
+    if not is_authorized(request.headers.get('Authorization')):
+        logger.warning("Unauthorized access attempt to /convert/batch")
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    # Parse and validate input
+    try:
+        data = parse_json_body()
+        lessons = validate_batch_data(data)
         
-        try:
-            return send_file(
-                tmp_path,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name='lesson.pdf'
-            )
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(tmp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp file: {e}")
+        # Exercises are validated as the document is generated
+        latex_source = generate_latex_batch(lessons)
+        
+    except BadRequest as e:
+        logger.warning(f"Bad request: {e}")
+        return jsonify({"error": str(e)}), 400
+    except ValueError as e:
+        logger.warning(f"Validation error: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error parsing request: {e}")
+        return jsonify({"error": "Invalid request format"}), 400
+    
+    # Compile
+    try:
+        logger.info(f"Generated LaTeX document for {len(lessons)} lessons ({len(latex_source)} bytes)")
+        
+        return pdf_response(latex_source, download_name='lessons.pdf')
         
     except RuntimeError as e:
         logger.error(f"Compilation error: {e}")
@@ -476,6 +963,9 @@ if __name__ == '__main__':
     
     logger.info(f"Starting server on port {port}")
     logger.info(f"Max exercises: {MAX_EXERCISES}")
+    logger.info(f"Max lessons per batch: {MAX_BATCH}")
     logger.info(f"Max content length: {MAX_CONTENT_LENGTH} bytes")
     
+    warm_up_compiler()
+    
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,44 @@
+"""
+Gunicorn configuration for the LaTeX to PDF Conversion Service
+Runs several worker processes with threads so concurrent conversions are
+not serialized behind a single request thread
+"""
+import os
+import subprocess
+import sys
+
+
+def _usable_cpus() -> int:
+    """Count the CPUs this process may run on (not the host's total)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# One process per usable core; each thread releases the GIL while waiting
+# on LaTeX. CPU quotas (docker --cpus) are not visible here, so set
+# WEB_WORKERS explicitly when running under one.
+workers = int(os.environ.get("WEB_WORKERS", _usable_cpus()))
+threads = int(os.environ.get("WEB_THREADS", "4"))
+worker_class = "gthread"
+
+# Allow for multiple compiler passes (30s timeout each) plus fallback
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+
+accesslog = "-"
+
+
+def on_starting(server):
+    """Warm up the LaTeX compiler once before workers are forked."""
+    # Run in a child process: importing app here would leave it in the
+    # master's sys.modules, silently preloading it into every worker and
+    # defeating code reloads on HUP
+    try:
+        subprocess.run(
+            [sys.executable, "-c", "import app; app.warm_up_compiler()"],
+            timeout=300
+        )
+    except Exception as e:
+        server.log.warning(f"LaTeX warm-up failed: {e}")